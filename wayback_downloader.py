@@ -1,150 +1,735 @@
-import re, datetime, argparse, time, requests, os, json
+import re, sys, argparse, time, requests, os, json, asyncio, string, itertools, threading, mmap, hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 64 * 1024
+WRITE_BUFFER_SIZE = 1 << 20
+URL_BATCH_SIZE = 1000
+CDX_PAGE_SIZE = 10000
+CDX_TIMEOUT = 60
+FSYNC_INTERVAL = 1000
+ETAGS_FILE = ".etags.json"
+DIRECT_IO_THRESHOLD = 4 * 1024 * 1024
+DIRECT_IO_BUFFER_SIZE = 1 << 20
+SMALL_FILE_SIZE = 128 * 1024
+SMALL_FILE_BATCH = 64
+IOV_MAX = 1024  # Linux limit on buffers per writev()
+RETRIES = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Everything outside [a-zA-Z0-9_.-] is replaced with '_' in file names
+_ALLOWED_CHARS = set(string.ascii_letters + string.digits + "_.-")
+_SANITIZE_TABLE = str.maketrans({chr(i): "_" for i in range(128) if chr(i) not in _ALLOWED_CHARS})
+# https://web.archive.org/web/<timestamp>if_/<original url>[?query]
+_URL_RE = re.compile(r"/web/([^/]+)if_/([^?]*)")
 
 class colors:
     CYAN = '\033[96m'
     WARNING = '\033[93m'
     ENDC = '\033[0m'
 
+# No color codes when the output is piped to a file
+_LOG_FORMAT = (f"{colors.CYAN}[{colors.WARNING}debug{colors.CYAN}][%s] {colors.ENDC}%s\n"
+               if sys.stdout.isatty() else "[debug][%s] %s\n")
+
 def logger(debug, message):
     if debug:
-        current_time = datetime.datetime.now().strftime("%H:%M:%S")
-        print(f"{colors.CYAN}[{colors.WARNING}debug{colors.CYAN}][{current_time}] {colors.ENDC}{message}")
+        # A single write, so lines from worker threads don't interleave
+        sys.stdout.write(_LOG_FORMAT % (time.strftime("%H:%M:%S"), message))
+
+def json_dumps(obj, indent=False):
+    # Always bytes, so callers write the same way with or without orjson
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode()
+
+def json_loads(data):
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
 
 def setup_argparse():
     parser = argparse.ArgumentParser(description="Robo Finder")
     parser.add_argument("--debug", action="store_true", default=False, help="Enable debugging mode.")
     parser.add_argument("--url", "-u", type=str, help="Base URL for archive search.")
     parser.add_argument("--retry", "-r", type=str, help="Path to status file for retrying failed downloads.")
+    parser.add_argument("--concurrency", "-c", type=positive_int, default=32, help="Number of simultaneous downloads.")
+    parser.add_argument("--refresh", action="store_true", default=False, help="Re-check existing files and download the ones that changed.")
+    parser.add_argument("--o-direct", action="store_true", default=False, help="Write files over 4 MiB with O_DIRECT, bypassing the page cache (Linux only).")
     return parser.parse_args()
 
+def make_session(pool_maxsize=64):
+    session = requests.Session()
+    retries = Retry(total=RETRIES, backoff_factor=RETRY_BACKOFF, status_forcelist=RETRY_STATUSES)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = "wayback_downloader/1.0"
+    return session
+
+def sanitize(name):
+    if not name.isascii():
+        # One '?' per non-ASCII character, which the table then maps to '_'
+        name = name.encode("ascii", "replace").decode("ascii")
+    return name.translate(_SANITIZE_TABLE)
+
 def construct_file_name(url):
-    try:
-        start = url.index("/web/") + 5
-        end = url.index("if_/")
-        timestamp = url[start:end]
-        path = url[end + 4:].split('?', 1)[0]  # Remove query parameters
-        file_name = os.path.basename(path)
-        sanitized_file_name = re.sub(r'[^a-zA-Z0-9_.-]', '_', file_name)  # Replace invalid characters
-        return f"{timestamp}_{sanitized_file_name}"
-    except ValueError:
+    match = _URL_RE.search(url)
+    if not match:
         return None
+    timestamp, path = match.groups()
+    file_name = path.rsplit('/', 1)[-1]
+    return f"{timestamp}_{sanitize(file_name)}"
 
-def downloader(urls, debug, base_url):
+def plan_downloads(urls, log, debug, etags, refresh=False):
+    # One directory listing instead of a stat() per URL
     current_directory = os.getcwd()
-    status = {"downloaded": [], "skipped": [], "errors": []}
+    existing = frozenset(entry.name for entry in os.scandir(current_directory))
+    # file_name is always a bare sanitized name, so os.path.join() is not needed
+    directory_prefix = current_directory + os.sep
+    seen = set()
 
     for url in urls:
         file_name = construct_file_name(url)
-        if file_name:
-            file_path = os.path.join(current_directory, file_name)
-            if os.path.exists(file_path):
-                logger(debug, f"File already exists, skipping download: {file_name}")
-                status["skipped"].append(file_name)
-                continue
+        if not file_name:
+            logger(debug, f"Could not construct a valid file name for URL: {url}")
+            log.record("error", url, error="Invalid file name")
+        elif file_name in seen:
+            logger(debug, f"Duplicate file name, skipping download: {file_name}")
+            log.record("skipped", url, file=file_name)
+        elif file_name in existing and not refresh:
+            logger(debug, f"File already exists, skipping download: {file_name}")
+            log.record("skipped", url, file=file_name)
+        else:
+            seen.add(file_name)
+            # Only ask for a 304 when there is a local copy to keep
+            headers = conditional_headers(etags.get(url, {})) if file_name in existing else {}
+            yield url, file_name, directory_prefix + file_name, headers
+
+def conditional_headers(validators):
+    headers = {}
+    if "ETag" in validators:
+        headers["If-None-Match"] = validators["ETag"]
+    if "Last-Modified" in validators:
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    return headers
+
+def cache_validators(url, response_headers, etags):
+    validators = {key: response_headers[key] for key in ("ETag", "Last-Modified") if key in response_headers}
+    if validators:
+        etags[url] = validators
+
+def load_etags(debug):
+    if not os.path.exists(ETAGS_FILE):
+        return {}
+    try:
+        with open(ETAGS_FILE, 'rb') as file:
+            return json_loads(file.read())
+    except json.JSONDecodeError as e:
+        logger(debug, f"Ignoring unreadable ETag cache: {e}")
+        return {}
+
+def save_etags(etags):
+    with open(ETAGS_FILE, 'wb') as file:
+        file.write(json_dumps(etags))
+
+class DirectWriter:
+    """File writer that bypasses the page cache with O_DIRECT (Linux only).
+
+    O_DIRECT needs block-aligned buffers and lengths, so data is staged in a
+    page-aligned anonymous mmap and written out a full buffer at a time. The
+    unaligned tail is written after clearing O_DIRECT on the descriptor.
+    """
+
+    def __init__(self, path, size):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT | getattr(os, "O_NOATIME", 0)
+        self.fd = os.open(path, flags, 0o644)
+        self.buffer = mmap.mmap(-1, DIRECT_IO_BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.used = 0
+        self.size = 0
+        try:
+            os.posix_fallocate(self.fd, 0, size)
+        except OSError:
+            pass  # Preallocation is only a hint
+
+    def write(self, data):
+        data = memoryview(data)
+        while data:
+            count = min(len(data), DIRECT_IO_BUFFER_SIZE - self.used)
+            self.view[self.used:self.used + count] = data[:count]
+            self.used += count
+            data = data[count:]
+            if self.used == DIRECT_IO_BUFFER_SIZE:
+                self._write_buffer()
+
+    def _write_buffer(self):
+        offset = 0
+        while offset < self.used:
+            offset += os.write(self.fd, self.view[offset:self.used])
+        self.size += self.used
+        self.used = 0
+
+    def close(self):
+        try:
+            if self.used:
+                flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+                fcntl.fcntl(self.fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+                self._write_buffer()
+            os.ftruncate(self.fd, self.size)  # Drop preallocated space past the real end
+        finally:
+            os.close(self.fd)
+            self.view.release()
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_output(path, size, o_direct=False):
+    if o_direct and size and size > DIRECT_IO_THRESHOLD:
+        try:
+            return DirectWriter(path, size)
+        except OSError:
+            pass  # Not every filesystem supports O_DIRECT (e.g. tmpfs)
+    return open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+
+def load_digests(log):
+    # sha256 of every file downloaded in earlier runs, so dedup works across runs
+    directory_prefix = os.getcwd() + os.sep
+    return {entry["sha256"]: directory_prefix + entry["file"]
+            for entry in read_status_log(log.path).values()
+            if entry["status"] == "downloaded" and "sha256" in entry}
+
+def write_hashed(file, hasher, data):
+    # hashlib releases the GIL on large buffers, so this overlaps like the write
+    hasher.update(data)
+    file.write(data)
+
+def link_duplicate(file_path, digest, digests):
+    # Snapshots are often byte-identical across timestamps; hard-link to an
+    # earlier file with the same digest. Returns the path linked to, or None.
+    original = digests.get(digest)
+    if original and original != file_path and os.path.exists(original):
+        link_path = file_path + ".link"
+        try:
+            os.link(original, link_path)
+            os.replace(link_path, file_path)
+            return original
+        except OSError:
+            pass  # No hard links on this filesystem, keep the copy
+    return None
+
+def finalize_download(part_path, file_path, digest, digests):
+    """Move a finished download into place, or drop it in favor of a hard
+    link to an identical file. Returns the path linked to, or None."""
+    original = link_duplicate(file_path, digest, digests)
+    if original:
+        os.remove(part_path)
+        return original
+    os.replace(part_path, file_path)
+    digests.setdefault(digest, file_path)
+    return None
+
+def write_chunks(path, chunks):
+    # One writev() of the received chunks, without joining them first
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        written = os.writev(fd, chunks) if hasattr(os, "writev") and len(chunks) <= IOV_MAX else 0
+        if written < sum(map(len, chunks)):
+            remaining = memoryview(b"".join(chunks))[written:]
+            while remaining:
+                remaining = remaining[os.write(fd, remaining):]
+    finally:
+        os.close(fd)
+
+def save_small(file_path, chunks, digest, digests):
+    original = link_duplicate(file_path, digest, digests)
+    if original:
+        return original
+    part_path = file_path + ".part"
+    write_chunks(part_path, chunks)
+    os.replace(part_path, file_path)
+    digests.setdefault(digest, file_path)
+    return None
+
+def is_small_response(headers, content_length):
+    # With a Content-Encoding the length is of the compressed body, which says
+    # nothing about how much the decoded chunks would hold in memory
+    return (content_length is not None and content_length <= SMALL_FILE_SIZE
+            and headers.get("Content-Encoding", "identity").lower() == "identity")
+
+def report_saved(url, file_name, digest, original, log, debug):
+    if original:
+        logger(debug, f"Identical to {os.path.basename(original)}, hard-linked: {file_name}")
+    else:
+        logger(debug, f"Downloaded and saved: {file_name}")
+    log.record("downloaded", url, file=file_name, sha256=digest)
+
+class SmallFileBatch:
+    """Small responses held in memory and written out SMALL_FILE_BATCH at a time.
+
+    Saving a file from the event loop costs several round trips to a worker
+    thread (open, write, close, rename). For favicons, stylesheets and the
+    like that dominates, so a whole batch is saved in one thread call.
+    """
+
+    def __init__(self, digests, log, debug):
+        self.digests = digests
+        self.log = log
+        self.debug = debug
+        self.entries = []
+
+    async def add(self, url, file_name, file_path, chunks, digest):
+        self.entries.append((url, file_name, file_path, chunks, digest))
+        if len(self.entries) >= SMALL_FILE_BATCH:
+            await self.flush()
+
+    async def flush(self):
+        entries, self.entries = self.entries, []
+        if entries:
+            await asyncio.to_thread(self._save, entries)
+
+    def _save(self, entries):
+        for url, file_name, file_path, chunks, digest in entries:
+            original = save_small(file_path, chunks, digest, self.digests)
+            report_saved(url, file_name, digest, original, self.log, self.debug)
+
+async def get_with_retries(session, url, headers):
+    # The same retries as make_session() gives the thread pool: a transient
+    # 429/5xx is retried with exponential backoff, honoring Retry-After
+    for attempt in range(RETRIES):
+        response = await session.get(url, headers=headers)
+        if response.status not in RETRY_STATUSES:
+            return response
+        retry_after = response.headers.get("Retry-After", "")
+        response.release()
+        delay = int(retry_after) if retry_after.isdigit() else RETRY_BACKOFF * 2 ** attempt
+        await asyncio.sleep(delay)
+    return await session.get(url, headers=headers)
+
+async def download_one(session, url, file_name, file_path, headers, etags, digests, small_files, log, debug, o_direct=False):
+    # Written next to the target and renamed into place, so neither a failed
+    # download nor a failed --refresh leaves a truncated file behind
+    part_path = file_path + ".part"
+    try:
+        async with await get_with_retries(session, url, headers) as response:
+            if response.status == 304:
+                logger(debug, f"Not modified, keeping: {file_name}")
+                log.record("unchanged", url, file=file_name)
+                return
+            response.raise_for_status()
+            hasher = hashlib.sha256()
+            if is_small_response(response.headers, response.content_length):
+                chunks = []
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    chunks.append(chunk)
+                cache_validators(url, response.headers, etags)
+                await small_files.add(url, file_name, file_path, chunks, hasher.hexdigest())
+                return
+            # File I/O runs in worker threads; every call is a round trip, so gather
+            # the chunks in memory and hand them over in WRITE_BUFFER_SIZE batches.
+            file = await asyncio.to_thread(open_output, part_path, response.content_length, o_direct)
             try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                with open(file_path, 'wb') as file:
-                    file.write(response.content)
-                logger(debug, f"Downloaded and saved: {file_name}")
-                status["downloaded"].append(file_name)
-            except requests.exceptions.RequestException as e:
-                logger(debug, f"Failed to download {url}: {e}")
-                status["errors"].append({"url": url, "error": str(e)})
+                pending = bytearray()
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    pending += chunk
+                    if len(pending) >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(write_hashed, file, hasher, pending)
+                        pending.clear()
+                if pending:
+                    await asyncio.to_thread(write_hashed, file, hasher, pending)
+            finally:
+                await asyncio.to_thread(file.close)
+            digest = hasher.hexdigest()
+            original = await asyncio.to_thread(finalize_download, part_path, file_path, digest, digests)
+            cache_validators(url, response.headers, etags)
+        report_saved(url, file_name, digest, original, log, debug)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        logger(debug, f"Failed to download {url}: {e}")
+        log.record("error", url, error=str(e) or type(e).__name__)
+
+async def download_worker(session, queue, etags, digests, small_files, log, debug, o_direct=False):
+    while (item := await queue.get()) is not None:
+        await download_one(session, *item, etags, digests, small_files, log, debug, o_direct)
+
+async def run_downloads(urls, log, debug, etags, digests, concurrency=32, refresh=False, o_direct=False):
+    # aiohttp resolves through aiodns when it is installed; lookups are cached
+    # for ttl_dns_cache and IPv6/IPv4 attempts are raced after happy_eyeballs_delay.
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=600, happy_eyeballs_delay=0.1)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=10)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    planned = plan_downloads(urls, log, debug, etags, refresh)
+    small_files = SmallFileBatch(digests, log, debug)
+
+    # trust_env picks up HTTP(S)_PROXY like requests does for the CDX listing
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, trust_env=True) as session:
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(concurrency):
+                tg.create_task(download_worker(session, queue, etags, digests, small_files, log, debug, o_direct))
+            # urls may be a lazy CDX stream that blocks on the network, so pull it
+            # in a thread, a batch at a time, while the workers keep downloading.
+            while batch := await asyncio.to_thread(list, itertools.islice(planned, URL_BATCH_SIZE)):
+                for item in batch:
+                    await queue.put(item)
+            for _ in range(concurrency):
+                await queue.put(None)
+    await small_files.flush()
+
+def fetch_one(url, file_name, file_path, headers, session, etags, digests, log, debug, o_direct=False):
+    part_path = file_path + ".part"
+    try:
+        with session.get(url, headers=headers, timeout=10, stream=True) as response:
+            if response.status_code == 304:
+                logger(debug, f"Not modified, keeping: {file_name}")
+                log.record("unchanged", url, file=file_name)
+                return
+            response.raise_for_status()
+            hasher = hashlib.sha256()
+            size = int(response.headers.get("Content-Length") or 0)
+            if is_small_response(response.headers, size if "Content-Length" in response.headers else None):
+                chunks = []
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    hasher.update(chunk)
+                    chunks.append(chunk)
+                digest = hasher.hexdigest()
+                original = save_small(file_path, chunks, digest, digests)
+                cache_validators(url, response.headers, etags)
+                report_saved(url, file_name, digest, original, log, debug)
+                return
+            with open_output(part_path, size, o_direct) as file:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        write_hashed(file, hasher, chunk)
+            digest = hasher.hexdigest()
+            original = finalize_download(part_path, file_path, digest, digests)
+            cache_validators(url, response.headers, etags)
+        report_saved(url, file_name, digest, original, log, debug)
+    except requests.exceptions.RequestException as e:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        logger(debug, f"Failed to download {url}: {e}")
+        log.record("error", url, error=str(e))
+
+def download_threaded(urls, log, debug, session, etags, digests, concurrency=32, refresh=False, o_direct=False):
+    # Sockets and file writes release the GIL, so threads overlap the waits too
+    planned = plan_downloads(urls, log, debug, etags, refresh)
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Keep a bounded window of submitted downloads, topping it up as each
+        # one finishes, so a slow file never leaves the other workers idle
+        for item in planned:
+            if len(in_flight) >= concurrency * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()  # Re-raise unexpected errors from the worker
+            in_flight.add(executor.submit(fetch_one, *item, session, etags, digests, log, debug, o_direct))
+        for future in in_flight:
+            future.result()
+
+def download_all(urls, log, debug, session, concurrency, refresh=False, o_direct=False):
+    if o_direct and not hasattr(os, "O_DIRECT"):
+        logger(debug, "O_DIRECT is not supported on this platform, ignoring --o-direct.")
+        o_direct = False
+
+    etags = load_etags(debug)
+    digests = load_digests(log)
+    try:
+        if aiohttp is None or not hasattr(asyncio, "TaskGroup"):
+            # asyncio.TaskGroup needs Python 3.11
+            logger(debug, "aiohttp or asyncio.TaskGroup not available, downloading with a thread pool.")
+            download_threaded(urls, log, debug, session, etags, digests, concurrency, refresh, o_direct)
         else:
-            logger(debug, f"Could not construct a valid file name for URL: {url}")
-            status["errors"].append({"url": url, "error": "Invalid file name"})
+            asyncio.run(run_downloads(urls, log, debug, etags, digests, concurrency, refresh, o_direct))
+    finally:
+        save_etags(etags)
+
+def downloader(urls, debug, base_url, session, concurrency=32, refresh=False, o_direct=False):
+    status_file_name = f"status_{sanitize(base_url)}.json"
+    log_file_name = os.path.splitext(status_file_name)[0] + ".jsonl"
 
-    create_status_file(status, base_url, debug)
+    with StatusLog(log_file_name, debug) as log:
+        download_all(urls, log, debug, session, concurrency, refresh, o_direct)
+        if isinstance(urls, ArchiveLinks):
+            urls.record(log)
+
+    create_status_file(log_file_name, status_file_name, debug)
+
+class StatusLog:
+    """Append-only record of every URL outcome, one JSON object per line.
+
+    Entries are flushed as they happen, so an interrupted run keeps its
+    progress. Later entries for a URL supersede earlier ones.
+    """
+
+    def __init__(self, path, debug):
+        self.path = path
+        self.file = open(path, 'ab', buffering=0)  # Unbuffered: one write() per entry
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        if fcntl:
+            try:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger(debug, f"Status log is in use by another process: {path}")
+                exit(1)
+
+    def record(self, status, url, **fields):
+        line = json_dumps({"status": status, "url": url, **fields}) + b"\n"
+        with self.lock:
+            self.file.write(line)
+            self.unsynced += 1
+            if self.unsynced >= FSYNC_INTERVAL:
+                os.fsync(self.file.fileno())
+                self.unsynced = 0
+
+    def close(self):
+        os.fsync(self.file.fileno())
+        self.file.close()  # Also releases the flock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_status_log(path):
+    latest = {}
+    with open(path, 'rb') as file:
+        for line in file:
+            try:
+                entry = json_loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn last line of an interrupted run
+            key = entry.get("url") or entry["file"]
+            # A file skipped because it exists is still downloaded as far as the summary goes
+            if entry["status"] == "skipped" and latest.get(key, {}).get("status") == "downloaded":
+                continue
+            latest[key] = entry
+    return latest
 
-def create_status_file(status, base_url, debug):
-    sanitized_url = re.sub(r'[^a-zA-Z0-9_.-]', '_', base_url)
-    status_file_name = f"status_{sanitized_url}.json"
+def create_status_file(log_file_name, status_file_name, debug):
+    status = {"downloaded": [], "skipped": [], "unchanged": [], "errors": []}
+    for entry in read_status_log(log_file_name).values():
+        if entry["status"] == "error":
+            status["errors"].append({"url": entry["url"], "error": entry["error"]})
+        elif entry["status"] in status:
+            status[entry["status"]].append(entry["file"])
 
-    with open(status_file_name, 'w') as status_file:
-        json.dump(status, status_file, indent=4)
+    with open(status_file_name, 'wb') as status_file:
+        status_file.write(json_dumps(status, indent=True))
 
     logger(debug, f"Status file created: {status_file_name}")
 
-def get_all_links(url, debug):
+def cdx_page_url(url, resume_key=None):
+    cdx_url = f"https://web.archive.org/cdx/search/cdx?url={url}&output=json&fl=timestamp,original&filter=statuscode:200&collapse=digest&limit={CDX_PAGE_SIZE}&showResumeKey=true"
+    if resume_key:
+        cdx_url += f"&resumeKey={quote(resume_key, safe='')}"
+    return cdx_url
+
+def fetch_cdx_page(url, session, resume_key=None):
+    # requests already sends Accept-Encoding for every codec urllib3 can decode
+    # (br too once brotli is installed), and the raw stream is decoded for ijson.
+    response = session.get(cdx_page_url(url, resume_key), stream=True, timeout=CDX_TIMEOUT)
+    response.raise_for_status()
+    return response
+
+def get_all_links(url, debug, session):
     logger(debug, "Fetching archive links.")
     try:
-        response = requests.get(f"https://web.archive.org/cdx/search/cdx?url={url}&output=json&fl=timestamp,original&filter=statuscode:200&collapse=digest")
-        response.raise_for_status()
-        obj = response.json()
+        response = fetch_cdx_page(url, session)
     except Exception as e:
         logger(debug, f"Failed to fetch archive data: {e}")
         exit(1)
 
-    url_list = [f"https://web.archive.org/web/{i[0]}if_/{i[1]}" for i in obj if len(i) > 1 and i != ["timestamp", "original"]]
-
-    logger(debug, f"Found {len(url_list)} archive links.")
-    if not url_list:
+    links = ArchiveLinks(url, session, debug, response=response)
+    # Checked before downloader() opens the status log, so an empty listing
+    # leaves no files behind
+    if links.is_empty() and links.error is None:
         logger(debug, "No valid files found in the archive. Exiting...")
         exit(1)
+    return links
+
+class ArchiveLinks:
+    """Snapshot URLs of a site, yielded while the CDX pages are still arriving.
+
+    Each full CDX page ends with an empty row followed by [resume_key] for the
+    next one. If a page fails, iteration stops early with `error` set and
+    `resume_key` pointing at that page, so the listing can be continued later.
+    """
+
+    def __init__(self, url, session, debug, response=None, resume_key=None):
+        self.url = url
+        self.session = session
+        self.debug = debug
+        self.response = response
+        self.resume_key = resume_key
+        self.error = None
+        self.links = self._fetch_links()
+        self.peeked = []
 
-    return url_list
+    def __iter__(self):
+        yield from self.peeked
+        yield from self.links
+
+    def is_empty(self):
+        # Reads up to the first link, which is then still yielded by __iter__
+        self.peeked = list(itertools.islice(self.links, 1))
+        return not self.peeked
+
+    def _fetch_links(self):
+        count = 0
+        response, self.response = self.response, None
+        while True:
+            if response is None:
+                try:
+                    response = fetch_cdx_page(self.url, self.session, self.resume_key)
+                except Exception as e:
+                    self.fail(e)
+                    break
+            next_key = None
+            with response:
+                try:
+                    if ijson:
+                        response.raw.decode_content = True
+                        rows = ijson.items(response.raw, "item")
+                    else:
+                        rows = json_loads(response.content)
+                    end_of_page = False
+                    for row in rows:
+                        if not row:
+                            end_of_page = True
+                        elif end_of_page:
+                            next_key = row[0]
+                        elif len(row) > 1 and row != ["timestamp", "original"]:
+                            count += 1
+                            yield f"https://web.archive.org/web/{row[0]}if_/{row[1]}"
+                except Exception as e:
+                    self.fail(e)
+                    break
+            if not next_key:
+                break
+            logger(self.debug, f"Fetching next page of archive links after {count}.")
+            self.resume_key = next_key
+            response = None
+
+        logger(self.debug, f"Found {count} archive links.")
+
+    def fail(self, error):
+        self.error = str(error) or type(error).__name__
+        logger(self.debug, f"Failed to fetch archive data, listing is incomplete: {self.error}")
+
+    def record(self, log):
+        # Logged against the base URL, so a completed listing supersedes an
+        # earlier incomplete one; resume_key is where --retry continues from
+        if self.error:
+            log.record("error", self.url, error=f"Archive listing incomplete: {self.error}",
+                       resume_key=self.resume_key)
+        else:
+            log.record("listed", self.url)
 
-def retry_failed_downloads(status_file, debug):
+def retry_failed_downloads(status_file, debug, session, concurrency=32, refresh=False, o_direct=False):
     if not os.path.exists(status_file):
         logger(debug, f"Status file not found: {status_file}")
         exit(1)
 
-    try:
-        with open(status_file, 'r') as file:
-            status_data = json.load(file)
-    except json.JSONDecodeError as e:
-        logger(debug, f"Failed to parse status file: {e}")
-        exit(1)
+    # Either the .json summary or its .jsonl log may be passed; any other
+    # path is a summary, with its log kept next to it
+    base_name, extension = os.path.splitext(status_file)
+    if extension == ".jsonl":
+        status_file_name, log_file_name = base_name + ".json", status_file
+    elif extension == ".json":
+        status_file_name, log_file_name = status_file, base_name + ".jsonl"
+    else:
+        status_file_name, log_file_name = status_file, status_file + ".jsonl"
 
-    failed_urls = [item["url"] for item in status_data.get("errors", [])]
+    status_data = None
+    if not os.path.exists(log_file_name) or os.path.getsize(log_file_name) == 0:
+        # Summary written before status logs existed, the log is seeded from it
+        try:
+            with open(status_file_name, 'rb') as file:
+                status_data = json_loads(file.read())
+        except (OSError, json.JSONDecodeError) as e:
+            logger(debug, f"Failed to parse status file: {e}")
+            exit(1)
 
-    if not failed_urls:
-        logger(debug, "No failed downloads found in the status file.")
-        return
+    with StatusLog(log_file_name, debug) as log:
+        if status_data is not None:
+            for key in ("downloaded", "skipped"):
+                for file_name in status_data.get(key, []):
+                    log.record(key, None, file=file_name)
+            for item in status_data.get("errors", []):
+                log.record("error", item["url"], error=item["error"])
 
-    logger(debug, f"Retrying {len(failed_urls)} failed downloads.")
-    
-    for url in failed_urls:
-        file_name = construct_file_name(url)
-        if file_name:
-            file_path = os.path.join(os.getcwd(), file_name)
-            if os.path.exists(file_path):
-                logger(debug, f"File already exists, skipping retry: {file_name}")
-                continue
-            try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                with open(file_path, 'wb') as file:
-                    file.write(response.content)
-                logger(debug, f"Downloaded and saved: {file_name}")
-                status_data["downloaded"].append(file_name)
-                # Remove retried URL from errors
-                status_data["errors"] = [e for e in status_data["errors"] if e["url"] != url]
-            except requests.exceptions.RequestException as e:
-                logger(debug, f"Failed again to download {url}: {e}")
-                # Update the error message in the status file
-                for error_entry in status_data["errors"]:
-                    if error_entry["url"] == url:
-                        error_entry["error"] = str(e)
-
-    # Save updated status file
-    with open(status_file, 'w') as file:
-        json.dump(status_data, file, indent=4)
-
-    logger(debug, f"Updated status file: {status_file}")
+        failed = [entry for entry in read_status_log(log_file_name).values() if entry["status"] == "error"]
+        failed_urls = [entry["url"] for entry in failed if "resume_key" not in entry]
+        # Listings that stopped early continue from the page that failed
+        listings = [ArchiveLinks(entry["url"], session, debug, resume_key=entry["resume_key"])
+                    for entry in failed if "resume_key" in entry]
+
+        if not failed:
+            logger(debug, "No failed downloads found in the status file.")
+            return
+
+        logger(debug, f"Retrying {len(failed_urls)} failed downloads and {len(listings)} incomplete listings.")
+        download_all(itertools.chain(failed_urls, *listings), log, debug, session, concurrency, refresh, o_direct)
+        for listing in listings:
+            listing.record(log)
+
+    create_status_file(log_file_name, status_file_name, debug)
+
+    if any(listing.error for listing in listings):
+        logger(debug, "Archive listing is still incomplete.")
+        exit(1)
 
 
 def main():
     args = setup_argparse()
     start_time = time.time()
     logger(args.debug, "Program started.")
+    session = make_session(pool_maxsize=args.concurrency)
 
     if args.retry:
-        retry_failed_downloads(args.retry, args.debug)
+        retry_failed_downloads(args.retry, args.debug, session, args.concurrency, args.refresh, args.o_direct)
     elif args.url:
-        url_list = get_all_links(args.url, args.debug)
-        downloader(url_list, args.debug, args.url)
+        url_list = get_all_links(args.url, args.debug, session)
+        downloader(url_list, args.debug, args.url, session, args.concurrency, args.refresh, args.o_direct)
+        if url_list.error:
+            logger(args.debug, "Archive listing is incomplete, use --retry to continue it.")
+            exit(1)
     else:
         logger(args.debug, "No valid input provided. Use --url or --retry.")
 